@@ -3,44 +3,138 @@ from qmp import QEMUMonitorProtocol
 import sys
 import os, os.path
 import json
+import logging
+import queue
+import random
+import re
 import subprocess
+import threading
 import time
 import socket
 import struct
 import datetime
 
+# Silent by default; set DEDI_LOG_LEVEL=DEBUG to watch the control path.
+logging.basicConfig(level=os.environ.get('DEDI_LOG_LEVEL', 'INFO'))
+log = logging.getLogger(__name__)
+
+# Matches the 0x-prefixed byte values in a monitor memory dump.  The 0x
+# anchor keeps the bare hex of the per-line address prefixes out of the
+# result, so no separate prefix-stripping pass is needed.
+_BYTE_RE = re.compile(r'0x([0-9a-fA-F]{2})')
+
+# Shared command dicts for argument-less commands, so query-status and
+# friends reuse the same object instead of rebuilding it per call.
+_NAME_CMDS = {}
+
+# One command dict per (qcode, hold-time), built on first use and reused so
+# repeat presses skip the dict rebuild and re-serialization setup.
+_KEY_CMDS = {}
+
+def _key_cmd(key, hold_time=250):
+  cmd = _KEY_CMDS.get((key, hold_time))
+  if cmd is None:
+    cmd = {
+        "execute": "send-key",
+        "arguments": {"keys": [{"type": "qcode", "data": key}],
+                      "hold-time": hold_time}
+    }
+    _KEY_CMDS[(key, hold_time)] = cmd
+  return cmd
+
 #The test class is JayFoxRox's code.
 class Test(object):
 
+  def __init__(self):
+    self._qmp = None
+    self._p = None
+    self._events = queue.Queue()
+    # cmd_obj and pull_event share the QMP socket, so command traffic and
+    # the event pump must never interleave on it
+    self._qmp_lock = threading.Lock()
+
+  def start_event_pump(self):
+    """Drain async QMP events onto a queue from a background thread."""
+    threading.Thread(target=self._event_pump, daemon=True).start()
+
+  def _event_pump(self):
+    while True:
+      try:
+        with self._qmp_lock:
+          event = self._qmp.pull_event(wait=False)
+      except Exception:
+        break
+      if event is None:
+        time.sleep(0.1)
+      else:
+        self._events.put(event)
+
+  def wait_for_event(self, name, timeout=30):
+    """Block until the named QMP event arrives; None on timeout."""
+    deadline = time.time() + timeout
+    while True:
+      remaining = deadline - time.time()
+      if remaining <= 0:
+        return None
+      try:
+        event = self._events.get(timeout=remaining)
+      except queue.Empty:
+        return None
+      if event.get('event') == name:
+        return event
+
   def stop(self):
     if self._p:
       self._p.terminate()
       self._p = None
 
-  def run_cmd(self, cmd):
-    if type(cmd) is str:
-      cmd = {
-          "execute": cmd, 
-          "arguments": {}
-      }
-    resp = self._qmp.cmd_obj(cmd)
+  def run_cmd_obj(self, cmd):
+    with self._qmp_lock:
+      resp = self._qmp.cmd_obj(cmd)
     if resp is None:
       raise Exception('Disconnected!')
     return resp
 
+  def run_cmd_name(self, name):
+    cmd = _NAME_CMDS.get(name)
+    if cmd is None:
+      cmd = {
+          "execute": name,
+          "arguments": {}
+      }
+      _NAME_CMDS[name] = cmd
+    return self.run_cmd_obj(cmd)
+
+  def run_cmd(self, cmd):
+    if type(cmd) is str:
+      return self.run_cmd_name(cmd)
+    return self.run_cmd_obj(cmd)
+
   def run_cmd2(self, cmd, arg):
     if type(cmd) is str:
       cmd = {
-          "execute": cmd, 
-          "arguments": {"keys":[ {"type": "qcode", "data": arg}],
+          "execute": cmd,
+          "arguments": {"keys": [{"type": "qcode", "data": arg}],
                         "hold-time": 250}
-          
       }
-      print(cmd)
-    resp = self._qmp.cmd_obj(cmd)
-    if resp is None:
-      raise Exception('Disconnected!')
-    return resp
+      log.debug("sending %s", cmd)
+    return self.run_cmd_obj(cmd)
+
+  def send_keys(self, keys, spacing=0, hold_time=250):
+    # With no spacing the whole sequence goes out as one QMP command.  A
+    # keys array in a single send-key is pressed as a chord though, so when
+    # the guest needs time between keystrokes (menu navigation) we fall back
+    # to one command per key with a sleep in between.
+    if not spacing:
+      cmd = {
+          "execute": "send-key",
+          "arguments": {"keys": [{"type": "qcode", "data": k} for k in keys],
+                        "hold-time": hold_time}
+      }
+      return self.run_cmd_obj(cmd)
+    for k in keys:
+      self.run_cmd_obj(_key_cmd(k, hold_time))
+      time.sleep(spacing)
 
   def pause(self):
     return self.run_cmd('stop')
@@ -64,52 +158,56 @@ class Test(object):
     resp = self.run_cmd('query-status')
     return resp['return']['status'] == 'paused'
 
+  def wait_running(self, deadline=60, poll=0.1):
+    start = time.time()
+    while time.time() - start < deadline:
+      resp = self.run_cmd_name('query-status')
+      if resp['return']['status'] == 'running':
+        return True
+      time.sleep(poll)
+    return False
+
   def read(self, addr, size):
     cmd = {
-        "execute": "human-monitor-command", 
-        "arguments": { "command-line": "x /%dxb %d" % (size,addr) }
+        "execute": "human-monitor-command",
+        "arguments": { "command-line": "xp /%dxb %d" % (size,addr) }
     }
     response = self.run_cmd(cmd)
-    lines = response['return'].replace('\r', '').split('\n')
-    data_string = ' '.join(l.partition(': ')[2] for l in lines).strip()
-    data = bytes(int(b, 16) for b in data_string.split(' '))
+    # One tokenizing pass over the dump, then one C-level hex decode.
+    data = bytes.fromhex(''.join(_BYTE_RE.findall(response['return'])))
     return data
 
 
 t = Test()
-i = 0
 
-#The connection loop is JayFoxRox's code.
-while True:
-  print('Trying to connect %d' % i)
-  if i > 0: time.sleep(1)
+#The connection loop is based on JayFoxRox's code, with exponential
+#backoff + full jitter instead of a fixed 1 second between attempts:
+#retries start at tens of ms while QMP is still coming up and back off
+#to at most 2 seconds under sustained failure.
+delay = 0.05
+for attempt in range(8):
+  print('Trying to connect %d' % attempt)
   try:
     t._qmp = QEMUMonitorProtocol(('localhost', 4444))
     t._qmp.connect()
+    break
   except Exception as e:
-    if i > 4:
+    if attempt == 7:
       raise
-    else:
-      i += 1
-      continue
-  break
+    time.sleep(random.uniform(0, delay))
+    delay = min(delay * 2, 2.0)
+
+#keep async events (VM state changes etc.) from piling up in the
+#transport for the rest of the session
+t.start_event_pump()
 
 import time
-print("wait 15 seconds")
+#start the clock only once the VM is actually running (it may still be
+#paused right after QMP comes up), then give the game a fixed window to
+#reach its menu - QMP can't observe guest-side boot progress
+t.wait_running()
+log.debug("wait 15 seconds")
 time.sleep(15)
-#wait some time
-t.run_cmd2("send-key", "return")
-print("wait 2 seconds")
-time.sleep(2)
-t.run_cmd2("send-key", "a")
-print("wait 2 seconds")
-time.sleep(2)
-t.run_cmd2("send-key", "a")
-print("wait 2 seconds")
-time.sleep(2)
-t.run_cmd2("send-key", "a")
-print("wait 2 seconds")
-time.sleep(2)
-t.run_cmd2("send-key", "a")
-print("wait 2 seconds")
-time.sleep(2)
\ No newline at end of file
+#startup menu navigation: enter the menu, then confirm through the prompts
+STARTUP_KEYS = ["return"] + ["a"] * 4
+t.send_keys(STARTUP_KEYS, spacing=2)
\ No newline at end of file
@@ -5,69 +5,150 @@ import time
 import sys
 import logging
 import argparse
+import threading
+import queue
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG,
                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def send_qmp_command(sock, command):
+# Preencoded wire frames for the fixed argument-less commands; these never
+# change, so encode them once at import instead of per call
+_STATIC_FRAMES = {
+    name: json.dumps({"execute": name}).encode() + b'\n'
+    for name in ("qmp_capabilities", "query-status", "query-chardev",
+                 "stop", "cont")
+}
+
+class QMPConnection:
+    """One QMP session: the socket, its buffered reader and the queue the
+    reader thread drains messages into.
+
+    socket.socket defines __slots__, so session state can't be stashed as
+    attributes on the socket itself - it lives here instead. Writes go
+    through self.sock.sendall; reads come off self.rqueue.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile('rb', buffering=65536)
+        self.rqueue = queue.Queue()
+
+    def close(self):
+        # Shut the socket down first so a reader thread blocked in
+        # readline() sees EOF and releases the buffered reader's lock;
+        # closing rfile while it's still blocked would deadlock
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.rfile.close()
+        self.sock.close()
+
+def start_qmp_reader(conn):
+    """Drain the connection on a dedicated thread.
+
+    The reader thread does nothing but readline() into the connection's
+    queue, so the socket buffer keeps draining even while the main thread
+    is busy with json.loads or log formatting. An empty-bytes sentinel
+    marks EOF.
+    """
+    rfile = conn.rfile
+    q = conn.rqueue
+
+    def pump():
+        for line in iter(rfile.readline, b''):
+            q.put(line)
+        q.put(b'')
+
+    threading.Thread(target=pump, daemon=True).start()
+
+def read_qmp_message(conn):
+    """Read one newline-delimited QMP message from the reader thread."""
+    return conn.rqueue.get()
+
+def send_qmp_command(conn, command):
     try:
-        # Log the command we're about to send
-        logger.debug(f"Sending command: {json.dumps(command, indent=2)}")
-        
-        # Send the command
-        sock.sendall(json.dumps(command).encode() + b'\n')
-        
-        # Get the response
-        response = b''
-        while True:
-            chunk = sock.recv(1024)
-            if not chunk:
-                break
-            response += chunk
-            try:
-                # Try to parse as JSON to see if we have a complete message
-                json.loads(response.decode())
-                break
-            except json.JSONDecodeError:
-                continue
-        
+        # Log the command we're about to send - only pay the json.dumps
+        # formatting cost when DEBUG records are actually emitted
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Sending command: {json.dumps(command)}")
+
+        # Send the command, reusing the preencoded frame for the static ones
+        frame = None
+        if command.keys() == {"execute"}:
+            frame = _STATIC_FRAMES.get(command["execute"])
+        if frame is None:
+            frame = json.dumps(command).encode() + b'\n'
+        conn.sock.sendall(frame)
+
+        # Get the response - QMP messages are newline-delimited JSON, so one
+        # readline() on the buffered reader is a complete message
+        response = read_qmp_message(conn)
+
         response_str = response.decode()
-        logger.debug(f"Raw response: {response_str}")
-        
-        # Try to parse the response as JSON for better logging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Raw response: {response_str}")
+
+        # Make sure the response is valid JSON
         try:
-            response_json = json.loads(response_str)
-            logger.debug(f"Parsed response: {json.dumps(response_json, indent=2)}")
+            json.loads(response_str)
         except json.JSONDecodeError:
             logger.warning("Could not parse response as JSON")
-        
+
         return response_str
     except Exception as e:
         logger.error(f"Error sending command: {e}", exc_info=True)
         return None
 
+def send_qmp_pipeline(conn, commands):
+    """Send several QMP commands in one flush and drain all the replies.
+
+    Each command gets a unique "id" so the replies can be matched back up.
+    Saves a round-trip per command compared to send/recv one at a time.
+    Returns a dict of id -> parsed reply, or None on error.
+    """
+    try:
+        tagged = []
+        for i, command in enumerate(commands):
+            command = dict(command, id=str(i))
+            tagged.append(json.dumps(command).encode())
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Pipelining {len(tagged)} commands")
+
+        conn.sock.sendall(b'\n'.join(tagged) + b'\n')
+
+        # Drain one reply per command; skip async events (no "id" field)
+        responses = {}
+        while len(responses) < len(tagged):
+            message = json.loads(read_qmp_message(conn))
+            if 'id' in message:
+                responses[message['id']] = message
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Pipeline responses: {json.dumps(responses)}")
+        return responses
+    except Exception as e:
+        logger.error(f"Error pipelining commands: {e}", exc_info=True)
+        return None
+
 def connect_to_qmp():
     try:
         # Create a socket connection
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # QMP is small request/response frames: disable Nagle so commands
+        # aren't held back waiting for delayed ACKs, and give the kernel a
+        # generous receive buffer so big replies don't backpressure QEMU
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 262144)
         s.connect(('localhost', 4444))
         logger.info("Connected to QMP server")
 
+        conn = QMPConnection(s)
+        start_qmp_reader(conn)
+
         # Read the greeting
-        greeting = b''
-        while True:
-            chunk = s.recv(1024)
-            if not chunk:
-                break
-            greeting += chunk
-            try:
-                json.loads(greeting.decode())
-                break
-            except json.JSONDecodeError:
-                continue
-        
+        greeting = read_qmp_message(conn)
         greeting_str = greeting.decode()
         logger.info(f"Received greeting: {greeting_str}")
         
@@ -81,12 +162,12 @@ def connect_to_qmp():
 
         # Send capabilities negotiation
         logger.info("Negotiating capabilities...")
-        response = send_qmp_command(s, {"execute": "qmp_capabilities"})
+        response = send_qmp_command(conn, {"execute": "qmp_capabilities"})
         if not response:
             logger.error("Failed to negotiate capabilities")
             return None
 
-        return s
+        return conn
     except ConnectionRefusedError:
         logger.error("Could not connect to xemu. Make sure xemu is running with QMP enabled.")
         logger.info("Start xemu with: open xemu.app --args -qmp tcp:localhost:4444,server,nowait")
@@ -101,18 +182,22 @@ def main():
     parser.add_argument('--cont', action='store_true', help='Resume the emulator')
     parser.add_argument('--status', action='store_true', help='Get emulator status')
     parser.add_argument('--button', action='store_true', help='Send A button press')
+    parser.add_argument('--batch', metavar='FILE',
+                       help='Send a JSON array of QMP commands from FILE in one pipelined flush')
+    parser.add_argument('--daemon', action='store_true',
+                       help='Keep the connection open and run QMP commands read from stdin (one JSON object per line)')
     args = parser.parse_args()
 
     # Connect to QMP
-    s = connect_to_qmp()
-    if not s:
+    conn = connect_to_qmp()
+    if not conn:
         sys.exit(1)
 
     try:
         # Get status if requested
         if args.status:
             logger.info("Getting emulator status...")
-            response = send_qmp_command(s, {"execute": "query-status"})
+            response = send_qmp_command(conn, {"execute": "query-status"})
             if not response:
                 logger.error("Failed to get status")
                 return
@@ -120,7 +205,7 @@ def main():
         # Stop if requested
         if args.stop:
             logger.info("Pausing emulator...")
-            response = send_qmp_command(s, {"execute": "stop"})
+            response = send_qmp_command(conn, {"execute": "stop"})
             if not response:
                 logger.error("Failed to pause emulator")
                 return
@@ -128,7 +213,7 @@ def main():
         # Continue if requested
         if args.cont:
             logger.info("Resuming emulator...")
-            response = send_qmp_command(s, {"execute": "cont"})
+            response = send_qmp_command(conn, {"execute": "cont"})
             if not response:
                 logger.error("Failed to resume emulator")
                 return
@@ -136,27 +221,25 @@ def main():
         # Send button press if requested
         if args.button:
             logger.info("Sending A button press...")
-            # First, get the device list to find the correct device name
-            response = send_qmp_command(s, {"execute": "query-chardev"})
-            if not response:
-                logger.error("Failed to get device list")
-                return
-            
-            # Send the A button press using the USB XID interface
-            response = send_qmp_command(s, {
-                "execute": "input-send-event",
-                "arguments": {
-                    "device": "usb-xbox-gamepad",
-                    "events": [{
-                        "type": "btn",
-                        "data": {
-                            "button": "0",  # A button code from xid.h
-                            "down": True
-                        }
-                    }]
+            # Pipeline the device-list query and the press in one flush;
+            # the release stays separate so the button is held for 100ms
+            responses = send_qmp_pipeline(conn, [
+                {"execute": "query-chardev"},
+                {
+                    "execute": "input-send-event",
+                    "arguments": {
+                        "device": "usb-xbox-gamepad",
+                        "events": [{
+                            "type": "btn",
+                            "data": {
+                                "button": "0",  # A button code from xid.h
+                                "down": True
+                            }
+                        }]
+                    }
                 }
-            })
-            if not response:
+            ])
+            if not responses:
                 logger.error("Failed to send button press")
                 return
 
@@ -165,7 +248,7 @@ def main():
 
             # Send button release
             logger.info("Sending A button release...")
-            response = send_qmp_command(s, {
+            response = send_qmp_command(conn, {
                 "execute": "input-send-event",
                 "arguments": {
                     "device": "usb-xbox-gamepad",
@@ -182,8 +265,35 @@ def main():
                 logger.error("Failed to send button release")
                 return
 
+        # Send a whole file of commands in one pipelined flush
+        if args.batch:
+            logger.info(f"Sending batch from {args.batch}...")
+            with open(args.batch) as f:
+                commands = json.load(f)
+            responses = send_qmp_pipeline(conn, commands)
+            if not responses:
+                logger.error("Failed to send batch")
+                return
+
+        # Daemon mode: keep the TCP + capability handshake from being paid
+        # per command by reading commands over stdin on one connection
+        if args.daemon:
+            logger.info("Daemon mode: reading QMP commands from stdin...")
+            for line in sys.stdin:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    command = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.error(f"Skipping invalid command: {line}")
+                    continue
+                response = send_qmp_command(conn, command)
+                if response:
+                    print(response.rstrip())
+
         # Close the connection
-        s.close()
+        conn.close()
         logger.info("Command sent successfully")
 
     except Exception as e:
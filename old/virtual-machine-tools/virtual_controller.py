@@ -3,11 +3,21 @@
 Enhanced Virtual USB Controller using evdev
 """
 
+import os
+import struct
 import time
 import threading
 import sys
 from evdev import UInput, ecodes as e
 
+# struct input_event: timeval (sec, usec), type, code, value.  Zero
+# timestamps are fine - the kernel fills them in on write.
+_INPUT_EVENT = struct.Struct('llHHI')
+
+# Countdown displays are pointless (and just extra I/O) when output goes
+# to a pipe or the journal instead of a terminal.
+_TTY = sys.stdout.isatty()
+
 class EnhancedVirtualController:
     """Enhanced virtual controller using evdev"""
     
@@ -45,19 +55,38 @@ class EnhancedVirtualController:
         """Press and release a button"""
         if not self.uinput:
             return
-            
-        # Press down
-        self.uinput.write(e.EV_KEY, button, 1)
-        self.uinput.syn()
-        
-        # Hold for duration
-        time.sleep(duration)
-        
-        # Release
-        self.uinput.write(e.EV_KEY, button, 0)
-        self.uinput.syn()
-        
+
+        if duration <= 0:
+            # No hold needed - pack press, release and their syn reports
+            # into one buffer and hand the kernel all four events in a
+            # single write, skipping evdev's per-event InputEvent objects
+            buf = (_INPUT_EVENT.pack(0, 0, e.EV_KEY, button, 1) +
+                   _INPUT_EVENT.pack(0, 0, e.EV_SYN, e.SYN_REPORT, 0) +
+                   _INPUT_EVENT.pack(0, 0, e.EV_KEY, button, 0) +
+                   _INPUT_EVENT.pack(0, 0, e.EV_SYN, e.SYN_REPORT, 0))
+            os.write(self.uinput.fd, buf)
+        else:
+            # Press down
+            self.uinput.write(e.EV_KEY, button, 1)
+            self.uinput.syn()
+
+            # Hold for duration
+            time.sleep(duration)
+
+            # Release
+            self.uinput.write(e.EV_KEY, button, 0)
+            self.uinput.syn()
+
         print(f"Button {button} pressed for {duration}s")
+
+    def press_buttons(self, events):
+        """Write a batch of (button, state) events with a single syn()"""
+        if not self.uinput:
+            return
+
+        for button, state in events:
+            self.uinput.write(e.EV_KEY, button, state)
+        self.uinput.syn()
     
     def ask_permission(self, timeout: int = 30):
         """Ask for permission to start button sequence with timeout"""
@@ -67,24 +96,34 @@ class EnhancedVirtualController:
         
         # Use threading to handle input with timeout
         user_input = [None]
-        
+        got_input = threading.Event()
+
         def get_input():
             try:
                 user_input[0] = input("Start sequence? (y/n): ").strip().lower()
             except EOFError:
                 user_input[0] = None
-        
+            got_input.set()
+
         input_thread = threading.Thread(target=get_input)
         input_thread.daemon = True
         input_thread.start()
-        
+
+        # Display-only countdown ticker; the event wait below is what
+        # actually reacts to input, so there's no per-second polling
+        def countdown():
+            for i in range(timeout, 0, -1):
+                print(f"\rAuto-starting in {i} seconds... (or press y/n)", end='', flush=True)
+                if got_input.wait(1):
+                    return
+
+        if _TTY:
+            ticker = threading.Thread(target=countdown, daemon=True)
+            ticker.start()
+
         # Wait for input or timeout
-        for i in range(timeout, 0, -1):
-            if user_input[0] is not None:
-                break
-            print(f"\rAuto-starting in {i} seconds... (or press y/n)", end='', flush=True)
-            time.sleep(1)
-        
+        got_input.wait(timeout)
+
         print()  # New line after countdown
         
         if user_input[0] is None:
@@ -120,11 +159,15 @@ class EnhancedVirtualController:
             # Press A button
             self.press_button(e.BTN_A)
             
-            # Wait for next sequence
-            for i in range(sequence_interval, 0, -1):
-                print(f"\rNext sequence in {i} seconds...", end='', flush=True)
-                time.sleep(1)
-            print()
+            # Wait for next sequence - only tick the display on a real
+            # terminal, otherwise sleep through the interval in one go
+            if _TTY:
+                for i in range(sequence_interval, 0, -1):
+                    print(f"\rNext sequence in {i} seconds...", end='', flush=True)
+                    time.sleep(1)
+                print()
+            else:
+                time.sleep(sequence_interval)
             
             count += 1
     